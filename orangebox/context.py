@@ -14,9 +14,9 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
-from typing import Dict, Optional, Tuple, Union
+from typing import Dict, List, Optional, Tuple, Union
 
-from .types import FieldDefs, Frame, FrameType, Headers, Number
+from .types import FieldDef, FieldDefs, Frame, FrameType, Headers, Number
 
 
 class Context:
@@ -28,6 +28,8 @@ class Context:
         self.data_version = headers.get("Data version", 1)  # type: int
         self.field_defs = field_defs  # type: FieldDefs
         self.field_def_counts = {k: len(v) for k, v in field_defs.items()}  # type: Dict[FrameType, int]
+        self.tag8_8svb_group_counts = {
+            k: _tag8_8svb_group_counts(v) for k, v in field_defs.items()}  # type: Dict[FrameType, Tuple[int, ...]]
         self.frame_count = 0  # count of parsed frames
         self.frame_type = None  # type: Optional[FrameType]
         self.field_index = 0  # index of current field
@@ -37,7 +39,7 @@ class Context:
             Frame(FrameType.INTRA, b''))  # type: Tuple[Frame, Frame, Frame]
         self.last_gps_frame = Frame(FrameType.GPS, b'')
         self.last_gps_home_frame = Frame(FrameType.GPS_HOME, b'')
-        self.current_frame = tuple()  # the current (possibly yet incomplete) frame
+        self.current_frame = []  # type: List[Number]  # the current (possibly yet incomplete) frame
         self.last_iter = -1
         self._names_to_indices = dict()  # type: Dict[FrameType, Dict[str, int]]
         for ftype in FrameType:
@@ -84,9 +86,11 @@ class Context:
                                   field_name: str,
                                   default: Number = 0) -> Number:
         try:
-            return self.current_frame[self._names_to_indices[frame_type][field_name]]
+            value = self.current_frame[self._names_to_indices[frame_type][field_name]]
         except (KeyError, IndexError):
             return default
+        # fields not decoded yet are None
+        return default if value is None else value
 
     def should_have_frame_at(self, index: int) -> bool:
         return (index % self.i_interval + self.p_interval_num - 1) % \
@@ -109,3 +113,17 @@ class Context:
             "invalid": self.invalid_frame_count,
             "invalid_percent": self.invalid_frame_count / self.read_frame_count * 100 if 0 < self.read_frame_count else 0,
         }
+
+
+def _tag8_8svb_group_counts(fdefs: List[FieldDef]) -> Tuple[int, ...]:
+    """Count the fields decoded together by tag8_8svb starting at each field index. A group consists of at most 8
+    adjacent fields sharing the same encoding.
+    """
+    counts = []
+    field_count = len(fdefs)
+    for i in range(field_count):
+        j = i + 1
+        while j < i + 8 and j < field_count and fdefs[j].encoding == 6:
+            j += 1
+        counts.append(j - i)
+    return tuple(counts)
@@ -14,32 +14,78 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
-from typing import Dict, Iterator, Optional
+from typing import Dict, Optional, TYPE_CHECKING
 
 from .context import Context
 from .tools import map_to, sign_extend_14bit, sign_extend_16bit, sign_extend_24bit, sign_extend_2bit, sign_extend_4bit, \
     sign_extend_6bit, sign_extend_8bit
 from .types import DecodedValue, Decoder
 
+if TYPE_CHECKING:
+    from .reader import Reader
+
+# decoders read the frame data of a Reader directly (buffer, pointer and next_byte()), plain iterators are not supported
 decoder_map = dict()  # type: Dict[int, Decoder]
 
 
 @map_to(0, decoder_map)
-def _signed_vb(data: Iterator[int], ctx: Optional[Context] = None) -> DecodedValue:
+def _signed_vb(data: "Reader", ctx: Optional[Context] = None) -> DecodedValue:
+    # fast path for single byte values, zigzag decoded inline
+    ptr = data._frame_data_ptr
+    if ptr < data._frame_data_len:
+        byte = data._frame_data[ptr]
+        if byte < 128:
+            data._frame_data_ptr = ptr + 1
+            return (byte >> 1) ^ -(byte & 1)
     value = _unsigned_vb(data, ctx)
-    value = ((value % 0x100000000) >> 1) ^ -(value & 1)
-    return value
+    return ((value & 0xFFFFFFFF) >> 1) ^ -(value & 1)
 
 
 # noinspection PyUnusedLocal
 @map_to(1, decoder_map)
-def _unsigned_vb(data: Iterator[int], ctx: Optional[Context] = None) -> DecodedValue:
+def _unsigned_vb(data: "Reader", ctx: Optional[Context] = None) -> DecodedValue:
+    # Variable byte decoding is the hottest path of the parser so instead of iterating over the reader byte by byte
+    # the (at most 5) bytes are read directly from the underlying buffer with the loop unrolled.
+    buf = data._frame_data
+    ptr = data._frame_data_ptr
+    if data._frame_data_len - ptr < 5:
+        return _unsigned_vb_tail(data)
+    byte = buf[ptr]
+    if byte < 128:
+        data._frame_data_ptr = ptr + 1
+        return byte
+    result = byte & 0x7F
+    byte = buf[ptr + 1]
+    if byte < 128:
+        data._frame_data_ptr = ptr + 2
+        return result | (byte << 7)
+    result |= (byte & 0x7F) << 7
+    byte = buf[ptr + 2]
+    if byte < 128:
+        data._frame_data_ptr = ptr + 3
+        return result | (byte << 14)
+    result |= (byte & 0x7F) << 14
+    byte = buf[ptr + 3]
+    if byte < 128:
+        data._frame_data_ptr = ptr + 4
+        return result | (byte << 21)
+    result |= (byte & 0x7F) << 21
+    byte = buf[ptr + 4]
+    data._frame_data_ptr = ptr + 5
+    if byte < 128:
+        return result | (byte << 28)
+    # integer too long
+    return 0
+
+
+def _unsigned_vb_tail(data: "Reader") -> int:
+    # slow path for the last few bytes of the frame data
     shift, result = 0, 0
     for i in range(5):
-        byte = next(data)
+        byte = data.next_byte()
 
         # EOF
-        if byte is None:
+        if byte < 0:
             return 0
 
         result = result | ((byte & ~0x80) << shift)
@@ -52,40 +98,32 @@ def _unsigned_vb(data: Iterator[int], ctx: Optional[Context] = None) -> DecodedV
 
 
 @map_to(3, decoder_map)
-def _neg_14bit(data: Iterator[int], ctx: Optional[Context] = None) -> DecodedValue:
+def _neg_14bit(data: "Reader", ctx: Optional[Context] = None) -> DecodedValue:
     return -sign_extend_14bit(_unsigned_vb(data, ctx))
 
 
 @map_to(6, decoder_map)
-def _tag8_8svb(data: Iterator[int], ctx: Optional[Context] = None) -> DecodedValue:
-    # count adjacent fields with same encoding
-    group_count = 8
-    fdeflen = ctx.field_def_counts[ctx.frame_type]
-    for i in range(ctx.field_index + 1, ctx.field_index + 8):
-        if i == fdeflen:
-            group_count = (fdeflen-1) - ctx.field_index
-            break
-        if ctx.field_defs[ctx.frame_type][i].encoding != 6:
-            group_count = i - ctx.field_index
-            break
+def _tag8_8svb(data: "Reader", ctx: Optional[Context] = None) -> DecodedValue:
+    # number of adjacent fields with same encoding is precomputed by the context
+    group_count = ctx.tag8_8svb_group_counts[ctx.frame_type][ctx.field_index]
     if group_count == 1:
         # single field
         return _signed_vb(data, ctx)
-    else:
-        # multiple fields
-        header = next(data)
-        values = ()
-        for _ in range(group_count):
-            values += (_signed_vb(data, ctx) if header & 0x01 else 0,)
-            header >>= 1
-        return values
+    # multiple fields
+    header = data.next_byte()
+    values = []
+    append = values.append
+    for _ in range(group_count):
+        append(_signed_vb(data, ctx) if header & 0x01 else 0)
+        header >>= 1
+    return tuple(values)
 
 
 # noinspection PyUnusedLocal
 @map_to(7, decoder_map)
-def _tag2_3s32(data: Iterator[int], ctx: Optional[Context] = None) -> DecodedValue:
-    lead = next(data)
-    if lead is None:
+def _tag2_3s32(data: "Reader", ctx: Optional[Context] = None) -> DecodedValue:
+    lead = data.next_byte()
+    if lead < 0:
         return 0, 0, 0
     shifted = lead >> 6
     if shifted == 0:  # 2bit fields
@@ -95,39 +133,36 @@ def _tag2_3s32(data: Iterator[int], ctx: Optional[Context] = None) -> DecodedVal
         return v1, v2, v3
     elif shifted == 1:  # 4bit fields
         v1 = sign_extend_4bit(lead & 0x0F)
-        lead = next(data)
+        lead = data.next_byte()
         v2 = sign_extend_4bit(lead >> 4)
         v3 = sign_extend_4bit(lead & 0x0F)
         return v1, v2, v3
     elif shifted == 2:  # 6bit fields
         v1 = sign_extend_6bit(lead & 0x3F)
-        lead = next(data)
+        lead = data.next_byte()
         v2 = sign_extend_6bit(lead & 0x3F)
-        lead = next(data)
+        lead = data.next_byte()
         v3 = sign_extend_6bit(lead & 0x3F)
         return v1, v2, v3
     elif shifted == 3:  # fields are 8, 16 or 24bit
         values = ()
+        buf = data._frame_data
         for _ in range(3):
             field_type = lead & 0x03
             if field_type == 0:  # 8bit
-                v1 = next(data)
+                v1 = data.next_byte()
                 values += (sign_extend_8bit(v1),)
-            elif field_type == 1:  # 16bit
-                v1 = next(data)
-                v2 = next(data)
-                values += (sign_extend_16bit(v1 | (v2 << 8)),)
-            elif field_type == 2:  # 24bit
-                v1 = next(data)
-                v2 = next(data)
-                v3 = next(data)
-                values += (sign_extend_24bit(v1 | (v2 << 8) | (v3 << 16)),)
-            elif field_type == 3:  # 32bit
-                v1 = next(data)
-                v2 = next(data)
-                v3 = next(data)
-                v4 = next(data)
-                values += (v1 | (v2 << 8) | (v3 << 16) | (v4 << 24),)
+            else:
+                # read little endian words in one go
+                ptr = data._frame_data_ptr
+                word = buf[ptr:ptr + field_type + 1]
+                data._frame_data_ptr = ptr + len(word)
+                if field_type == 1:  # 16bit
+                    values += (sign_extend_16bit(int.from_bytes(word, "little")),)
+                elif field_type == 2:  # 24bit
+                    values += (sign_extend_24bit(int.from_bytes(word, "little")),)
+                else:  # 32bit
+                    values += (int.from_bytes(word, "little"),)
             lead >>= 2
         return values
     return 0, 0, 0
@@ -141,16 +176,16 @@ def _tag8_4s16_versioned(data_version: int) -> Decoder:
         return _tag8_4s16_v2
 
 
-def _tag8_4s16_v1(_: Iterator[int], __: Optional[Context] = None) -> DecodedValue:
+def _tag8_4s16_v1(_: "Reader", __: Optional[Context] = None) -> DecodedValue:
     # TODO
     return "TODO:tag8_4s16_v1"
 
 
 # noinspection PyUnusedLocal
-def _tag8_4s16_v2(data: Iterator[int], ctx: Optional[Context] = None) -> DecodedValue:
-    selector = next(data)
+def _tag8_4s16_v2(data: "Reader", ctx: Optional[Context] = None) -> DecodedValue:
+    selector = data.next_byte()
     values = ()
-    if selector is None:
+    if selector < 0:
         return None
     nibble_index = 0
     buffer = 0
@@ -160,7 +195,7 @@ def _tag8_4s16_v2(data: Iterator[int], ctx: Optional[Context] = None) -> Decoded
             values += (0,)
         elif field_type == 1:  # field 4bit
             if nibble_index == 0:
-                buffer = next(data)
+                buffer = data.next_byte()
                 values += (sign_extend_4bit(buffer >> 4),)
                 nibble_index = 1
             else:
@@ -168,20 +203,22 @@ def _tag8_4s16_v2(data: Iterator[int], ctx: Optional[Context] = None) -> Decoded
                 nibble_index = 0
         elif field_type == 2:  # field 8bit
             if nibble_index == 0:
-                values += (sign_extend_8bit(next(data)),)
+                values += (sign_extend_8bit(data.next_byte()),)
             else:
                 v1 = (buffer & 0x0F) << 4
-                buffer = next(data)
+                buffer = data.next_byte()
                 v1 |= buffer >> 4
                 values += (sign_extend_8bit(v1),)
         elif field_type == 3:  # field 16bit
             if nibble_index == 0:
-                v1 = next(data)
-                v2 = next(data)
-                values += (sign_extend_16bit((v1 << 8) | v2),)
+                # byte aligned big endian word, decode it from a zero-copy slice of the frame data
+                ptr = data._frame_data_ptr
+                word = data._frame_data[ptr:ptr + 2]
+                data._frame_data_ptr = ptr + len(word)
+                values += (sign_extend_16bit(int.from_bytes(word, "big")),)
             else:
-                v1 = next(data)
-                v2 = next(data)
+                v1 = data.next_byte()
+                v2 = data.next_byte()
                 values += (sign_extend_16bit(((buffer & 0x0F) << 12) | (v1 << 4) | (v2 >> 4)),)
                 buffer = v2
         selector >>= 2
@@ -190,11 +227,11 @@ def _tag8_4s16_v2(data: Iterator[int], ctx: Optional[Context] = None) -> Decoded
 
 # noinspection PyUnusedLocal
 @map_to(9, decoder_map)
-def _null(data: Iterator[int], ctx: Optional[Context] = None) -> DecodedValue:
+def _null(data: "Reader", ctx: Optional[Context] = None) -> DecodedValue:
     return 0
 
 
 @map_to(10, decoder_map)
-def _tag2_3svariable(_: Iterator[int], __: Optional[Context] = None) -> DecodedValue:
+def _tag2_3svariable(_: "Reader", __: Optional[Context] = None) -> DecodedValue:
     # TODO
     return "TODO:tag2_3svariable"
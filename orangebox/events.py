@@ -14,15 +14,48 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+from struct import Struct
 from typing import Dict, Optional
 
-from .decoders import _unsigned_vb
+from .decoders import _signed_vb, _unsigned_vb
 from .reader import Reader
 from .tools import map_to
 from .types import EventParser, EventType
 
 END_OF_LOG_MESSAGE = b'End of log\x00'
 
+INFLIGHT_ADJUSTMENT_FUNCTIONS = (
+    {"name": "None"},
+    {"name": "RC Rate", "scale": 0.01},
+    {"name": "RC Expo", "scale": 0.01},
+    {"name": "Throttle Expo", "scale": 0.01},
+    {"name": "Pitch & Roll Rate", "scale": 0.01},
+    {"name": "Yaw rate", "scale": 0.01},
+    {"name": "Pitch & Roll P", "scale": 0.1, "scalef": 1},
+    {"name": "Pitch & Roll I", "scale": 0.001, "scalef": 0.1},
+    {"name": "Pitch & Roll D", "scalef": 1000},
+    {"name": "Yaw P", "scale": 0.1, "scalef": 1},
+    {"name": "Yaw I", "scale": 0.001, "scalef": 0.1},
+    {"name": "Yaw D", "scalef": 1000},
+    {"name": "Rate Profile"},
+    {"name": "Pitch Rate", "scale": 0.01},
+    {"name": "Roll Rate", "scale": 0.01},
+    {"name": "Pitch P", "scale": 0.1, "scalef": 1},
+    {"name": "Pitch I", "scale": 0.001, "scalef": 0.1},
+    {"name": "Pitch D", "scalef": 1000},
+    {"name": "Roll P", "scale": 0.1, "scalef": 1},
+    {"name": "Roll I", "scale": 0.001, "scalef": 0.1},
+    {"name": "Roll D", "scalef": 1000},
+)
+
+# flat lookup tables derived from the above to keep dict lookups out of event parsing
+_adjustment_names = tuple(descr["name"] for descr in INFLIGHT_ADJUSTMENT_FUNCTIONS)
+_adjustment_scales = tuple(descr.get("scale", 1) for descr in INFLIGHT_ADJUSTMENT_FUNCTIONS)
+_adjustment_float_scales = tuple(descr.get("scalef", descr.get("scale", 1)) for descr in INFLIGHT_ADJUSTMENT_FUNCTIONS)
+
+# float values are written as raw 32 bit little endian words
+_float32 = Struct("<f")
+
 event_map = dict()  # type: Dict[EventType, EventParser]
 
 
@@ -76,9 +109,39 @@ def twitch_test(_: Reader) -> Optional[dict]:
 
 
 @map_to(EventType.INFLIGHT_ADJUSTMENT, event_map)
-def inflight_adjustment(_: Reader) -> Optional[dict]:
-    # TODO
-    pass
+def inflight_adjustment(data: Reader) -> Optional[dict]:
+    tmp = data.next_byte()
+    if tmp < 0:
+        raise EOFError("Log ends before the adjustment function")
+    func = tmp & 127
+    end = data._frame_data_len
+    if tmp < 128:
+        if data.tell() == end:
+            raise EOFError("Log ends before the adjustment value")
+        value = _signed_vb(data)
+        if data.tell() == end and 128 <= data._frame_data[end - 1]:
+            # the last byte still has the continuation bit set
+            raise EOFError("Log ends inside the adjustment value")
+    else:
+        ptr = data.tell()
+        if end < ptr + 4:
+            data.seek(end)
+            raise EOFError("Log ends inside the adjustment value")
+        # unpack the float straight from the frame data without copying the bytes
+        value = _float32.unpack_from(data._frame_data, ptr)[0]
+        data.seek(ptr + 4)
+    if len(_adjustment_names) <= func:
+        return {
+            "name": "Unknown",
+            "func": func,
+            "value": value,
+        }
+    scale = _adjustment_float_scales[func] if 128 <= tmp else _adjustment_scales[func]
+    return {
+        "name": _adjustment_names[func],
+        "func": func,
+        "value": round(value * scale, 4),
+    }
 
 
 @map_to(EventType.LOGGING_RESUME, event_map)
@@ -15,7 +15,8 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 import logging
-from typing import Iterator, List, Optional
+from types import MappingProxyType
+from typing import Callable, Dict, Iterator, List, Mapping, Optional
 
 from .context import Context
 from .events import event_map
@@ -32,6 +33,9 @@ class Parser:
     """Parse and iterate over decoded frames.
     """
 
+    _FRAME_TYPE_CACHE = {ord(ft.value): ft for ft in FrameType}  # type: Dict[int, FrameType]
+    _EVENT_TYPE_CACHE = {et.value: et for et in EventType}  # type: Dict[int, EventType]
+
     def __init__(self, reader: Reader):
         """
         :param reader: The `.Reader` used to iterate over the relevant bits of bytes
@@ -40,9 +44,13 @@ class Parser:
         self._reader = reader
         self._events = []  # type: List[Event]
         self._headers = {}  # type: Headers
+        self._headers_view = MappingProxyType(self._headers)  # type: Mapping
         self._field_names = []  # type: List[str]
         self._end_of_log = False
         self._ctx = None  # type: Optional[Context]
+        self._frame_parsers = {}  # type: Dict[int, Callable[[], Optional[Frame]]]
+        self._empty_slow_data = ()  # type: tuple
+        self._empty_gps_data = ()  # type: tuple
         self.set_log_index(reader.log_index)
 
     def set_log_index(self, index: int):
@@ -60,7 +68,16 @@ class Parser:
         reader = self._reader
         reader.set_log_index(index)
         self._headers = {k: v for k, v in reader.headers.items() if "Field" not in k}
+        self._headers_view = MappingProxyType(self._headers)
         self._ctx = Context(self._headers, reader.field_defs)
+        # frame parsers are keyed by the frame marker byte
+        self._frame_parsers = {ord(ftype.value): self._make_frame_parser(ftype, fdefs)
+                               for ftype, fdefs in reader.field_defs.items()}
+        # placeholders for extra frame data until the first SLOW and GPS frames arrive (empty strings ensure the right
+        # amount of ',' are written out at least)
+        field_defs = reader.field_defs
+        self._empty_slow_data = ("",) * len(field_defs[FrameType.SLOW]) if FrameType.SLOW in field_defs else ()
+        self._empty_gps_data = ("",) * (len(field_defs[FrameType.GPS]) - 1) if FrameType.GPS in field_defs else ()
         self._field_names = []
         for ftype in [FrameType.INTRA, FrameType.SLOW, FrameType.GPS]:
             # Note: retaining the order above is important for communality with bb-log-viewer
@@ -85,22 +102,35 @@ class Parser:
 
         :rtype: Iterator[Frame]
         """
-        field_defs = self._reader.field_defs
-        last_slow = None  # type: Optional[Frame]
-        last_gps = None  # type: Optional[Frame]
+        last_slow_data = self._empty_slow_data
+        last_gps_data = self._empty_gps_data
         ctx = self._ctx  # type: Context
         reader = self._reader
         last_time = None
         last_iter = 0
         last_frame_pos = 0
         last_frame_is_corrupt = False
-        for byte in reader:
-            if byte is None:
-                return
-
-            try:
-                ftype = FrameType(chr(byte))
-            except ValueError:
+        frame_data = reader._frame_data
+        data_len = reader._frame_data_len
+        frame_type_cache = self._FRAME_TYPE_CACHE
+        frame_parsers = self._frame_parsers
+        # bind frequently used names to locals
+        frame_type_get = frame_type_cache.get
+        frame_parser_get = frame_parsers.get
+        add_frame = ctx.add_frame
+        get_current_value = ctx.get_current_value_by_name
+        parse_event_frame = self._parse_event_frame
+        intra_or_inter = (FrameType.INTRA, FrameType.INTER)
+        event_type = FrameType.EVENT
+        slow_type = FrameType.SLOW
+        gps_type = FrameType.GPS
+        while reader._frame_data_ptr < data_len:
+            # read frame markers directly from the buffer instead of going through the iterator protocol
+            byte = frame_data[reader._frame_data_ptr]
+            reader._frame_data_ptr += 1
+
+            ftype = frame_type_get(byte)
+            if ftype is None:
                 if not last_frame_is_corrupt:
                     reader.seek(last_frame_pos + 1)
                     ctx.invalid_frame_count += 1
@@ -111,9 +141,9 @@ class Parser:
             last_frame_is_corrupt = False
             last_frame_pos = reader.tell() - 1
 
-            if ftype == FrameType.EVENT:
+            if ftype is event_type:
                 # parse event frame (event frames do not depend on field defs)
-                if not self._parse_event_frame(reader):
+                if not parse_event_frame(reader):
                     ctx.invalid_frame_count += 1
                 ctx.read_frame_count += 1
                 if self._end_of_log:
@@ -123,14 +153,15 @@ class Parser:
                     break
                 continue
 
-            if ftype not in field_defs:
+            parse_frame = frame_parser_get(byte)
+            if parse_frame is None:
                 _log.warning("No field def found for frame type {!r}".format(ftype))
                 ctx.invalid_frame_count += 1
                 ctx.read_frame_count += 1
                 continue
 
             # decode INTRA, INTER, SLOW, GPS or GPS_HOME frame
-            frame = self._parse_frame(field_defs[ftype], reader)
+            frame = parse_frame()
 
             if frame is None:
                 _log.debug("Dropping {:s} Frame #{:d} because it's corrupt"
@@ -139,21 +170,20 @@ class Parser:
                 continue
 
             # store these frames to append them to subsequent frames:
-            if ftype == FrameType.SLOW:
-                last_slow = frame
-                ctx.read_frame_count += 1
-                continue
-            elif ftype == FrameType.GPS:
-                last_gps = frame
-                ctx.read_frame_count += 1
-                continue
-            elif ftype == FrameType.GPS_HOME:
-                ctx.add_frame(frame)
+            if ftype not in intra_or_inter:
+                if ftype is slow_type:
+                    last_slow_data = frame.data
+                elif ftype is gps_type:
+                    # add GPS frames the way blackbox-log-viewer seems to do it
+                    last_gps_data = frame.data[1:]  # skip time
+                else:
+                    # GPS_HOME
+                    add_frame(frame)
                 ctx.read_frame_count += 1
                 continue
 
             # validate frame
-            current_time = ctx.get_current_value_by_name(ftype, "time")
+            current_time = get_current_value(ftype, "time")
             if last_time is not None and last_time >= current_time and MAX_TIME_JUMP < current_time - last_time:
                 _log.debug("Invalid {:s} Frame #{:d} due to time desync".format(ftype.value, ctx.read_frame_count + 1))
                 last_time = current_time
@@ -161,7 +191,7 @@ class Parser:
                 ctx.invalid_frame_count += 1
                 continue
             last_time = current_time
-            current_iter = ctx.get_current_value_by_name(ftype, "loopIteration")
+            current_iter = get_current_value(ftype, "loopIteration")
             ctx.last_iter = current_iter
             if last_iter >= current_iter and MAX_ITER_JUMP < current_iter + last_iter:
                 _log.debug("Skipping {:s} Frame #{:d} due to iter desync".format(ftype.value, ctx.read_frame_count + 1))
@@ -171,104 +201,113 @@ class Parser:
                 continue
             last_iter = current_iter
 
-            # add in extra frames (GPS, GPS_HOME and SLOW)
-            extra_data = []
-
-            # add slow frames (list of empty strings if not available to ensure
-            # the right amount of ',' are written out at least)
-            if FrameType.SLOW in field_defs:
-                if last_slow:
-                    extra_data += last_slow.data
-                else:
-                    extra_data += [""] * len(field_defs[FrameType.SLOW])
-
-            # add GPS frames the way blackbox-log-viewer seems to do it
-            if FrameType.GPS in field_defs:
-                if last_gps:
-                    extra_data += list(last_gps.data[1:])  # skip time
-                else:
-                    extra_data += [""] * (len(field_defs[FrameType.GPS]) - 1)
+            # add in extra frames (SLOW and GPS)
+            frame = Frame(ftype, frame.data + last_slow_data + last_gps_data)
 
-            frame = Frame(ftype, frame.data + tuple(extra_data))
-
-            try:
-                FrameType(chr(reader.value() or 0))
-            except ValueError:
+            # the next byte must be a frame marker, otherwise this frame is likely corrupt
+            next_ptr = reader._frame_data_ptr
+            if data_len <= next_ptr or frame_data[next_ptr] not in frame_type_cache:
                 _log.debug("Dropping {:s} Frame #{:d} because it's corrupt"
                            .format(ftype.value, ctx.read_frame_count + 1))
                 ctx.invalid_frame_count += 1
                 continue
             ctx.read_frame_count += 1
-            ctx.add_frame(frame)
+            add_frame(frame)
             yield frame
 
-    def _parse_frame(self, fdefs: List[FieldDef], reader: Reader) -> Frame:
-        result = ()
+    def frames_to_dict(self) -> Dict[str, list]:
+        """Parse all the remaining frames and return their values in columns keyed by field name.
+
+        :rtype: Dict[str, list]
+        """
+        columns = [[] for _ in self._field_names]
+        appenders = [column.append for column in columns]
+        for frame in self.frames():
+            for append, value in zip(appenders, frame.data):
+                append(value)
+        return dict(zip(self._field_names, columns))
+
+    def _make_frame_parser(self, frame_type: FrameType, fdefs: List[FieldDef]) -> Callable[[], Optional[Frame]]:
+        """Return a function for decoding the next frame of the given type. Everything the decoding needs is captured
+        once per log instead of being looked up for each frame.
+        """
         ctx = self._ctx
-        ctx.field_index = 0
-        field_count = ctx.field_def_counts[ctx.frame_type]
-        while ctx.field_index < field_count:
-            # make current frame available in context
+        reader = self._reader
+        field_count = len(fdefs)
+        decoders = tuple(fdef.decoderfun for fdef in fdefs)
+        predictors = tuple(fdef.predictorfun for fdef in fdefs)
+
+        def parse_frame() -> Optional[Frame]:
+            # preallocate the frame since the number of fields is known
+            result = [None] * field_count
+            # make current frame available in context (the list is updated in place as fields get decoded)
             ctx.current_frame = result
-            fdef = fdefs[ctx.field_index]
-            # decode current field value
-            rawvalue = fdef.decoderfun(reader, ctx)
-            if rawvalue is None:
-                return None
-
-            # apply predictions
-            if isinstance(rawvalue, tuple):
-                value = ()
-                for v in rawvalue:
-                    fdef = fdefs[ctx.field_index]
-                    value += (fdef.predictorfun(v, ctx),)
-                    ctx.field_index += 1
-                result += value
-            else:
-                value = fdef.predictorfun(rawvalue, ctx)
-                ctx.field_index += 1
-                result += (value,)
-        return Frame(ctx.frame_type, result)
+            i = 0
+            while i < field_count:
+                ctx.field_index = i
+                # decode current field value
+                rawvalue = decoders[i](reader, ctx)
+                if rawvalue is None:
+                    return None
+
+                # apply predictions
+                if rawvalue.__class__ is tuple:
+                    for v in rawvalue:
+                        ctx.field_index = i
+                        result[i] = predictors[i](v, ctx)
+                        i += 1
+                else:
+                    result[i] = predictors[i](rawvalue, ctx)
+                    i += 1
+            ctx.field_index = i
+            return Frame(frame_type, tuple(result))
+
+        return parse_frame
 
     def _parse_event_frame(self, reader: Reader) -> bool:
-        byte = next(reader)
-        try:
-            event_type = EventType(byte)
-        except ValueError:
+        byte = reader.next_byte()
+        event_type = self._EVENT_TYPE_CACHE.get(byte)
+        if event_type is None:
             _log.warning("Unknown event type: {!r}".format(byte))
             return False
         _log.debug("New event frame #{:d}: {:s}".format(self._ctx.read_frame_count + 1, event_type.name))
         parser = event_map[event_type]  # type: EventParser
-        event_data = parser(reader)
-        self.events.append(Event(event_type, event_data))
+        try:
+            event_data = parser(reader)
+        except EOFError as e:
+            # the log was cut off in the middle of the event
+            _log.debug("Dropping {:s} event: {!s}".format(event_type.name, e))
+            return False
+        self._events.append(Event(event_type, event_data))
         if event_type == EventType.LOG_END:
             self._end_of_log = True
         return True
 
     @property
-    def headers(self) -> Headers:
-        """Headers key-value map. This will not contain the headers describing the field definitions. To get the raw
-        headers see `.Reader` instead. Key is a string, value can be a string, a number or a list of numbers.
+    def headers(self) -> Mapping:
+        """Read-only headers key-value map. This will not contain the headers describing the field definitions. To get
+        the raw headers see `.Reader` instead. Key is a string, value can be a string, a number or a list of numbers.
 
-        :type: dict
+        :type: Mapping
         """
-        return dict(self._headers)
+        return self._headers_view
 
     @property
     def events(self) -> List[Event]:
-        """Log events found during parsing. All the events are available only after parsing has finished.
+        """Log events found during parsing. All the events are available only after parsing has finished. This is the
+        parser's own list, do not modify it.
 
         :type: List[Event]
         """
-        return list(self._events)
+        return self._events
 
     @property
     def field_names(self) -> List[str]:
-        """A list of all field names found in the current header.
+        """A list of all field names found in the current header. This is the parser's own list, do not modify it.
 
         :type: List[str]
         """
-        return list(self._field_names)
+        return self._field_names
 
     @property
     def reader(self) -> Reader:
@@ -15,12 +15,17 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 import logging
-from typing import BinaryIO, Dict, Iterator, List, Optional
+import mmap
+import os
+import re
+from array import array
+from types import MappingProxyType
+from typing import BinaryIO, Callable, Dict, Iterator, List, Mapping, Optional, Sequence, Tuple, Union
 
 from .decoders import decoder_map
 from .predictors import predictor_map
-from .tools import _trycast
-from .types import FieldDef, FrameType, Headers
+from .tools import _trycast_bytes
+from .types import Decoder, FieldDef, FrameType, Headers
 
 MAX_FRAME_SIZE = 256
 
@@ -34,26 +39,58 @@ class Reader:
     .. todo:: Detecting and informing the user about possible file corruption (missing headers, etc.)
     """
 
+    EOF = -1
+    """Returned by `.next_byte()` at the end of the frame data
+    """
+
+    _FRAME_TYPE_BY_VALUE = {ft.value: ft for ft in FrameType}  # type: Dict[str, FrameType]
+    # field properties that may be set by 'Field <FrameType> <Property>' headers
+    _FIELD_PROPERTIES = ("name", "signed", "predictor", "encoding")
+    _VERSIONED_DECODER_CACHE = {}  # type: Dict[Tuple[Callable, int], Decoder]
+    # header lines look like 'H <name>:<value>', the block ends at the first line not matching this
+    _HEADERS_RE = re.compile(rb"(?:H [^:\n]*:[^\n]*(?:\n|\Z))*")
+    _HEADER_LINE_RE = re.compile(rb"(?m)^H ([^:\n]*):([^\n]*)")
+
+    __slots__ = ("_headers", "_headers_view", "_field_defs", "_field_defs_view", "_log_index", "_header_size", "_path",
+                 "_frame_data_ptr", "_log_pointers", "_frame_data", "_frame_data_len", "_mmap", "_mmap_view")
+
     def __init__(self, path: str, log_index: Optional[int] = None):
         """
         :param path: Path to a log file
         :param log_index: Session index within log file. If set to `None` (the default) there will be no session selected and headers and frame data won't be read until the first call to `.set_log_index()`.
         """
         self._headers = {}  # type: Headers
+        self._headers_view = MappingProxyType(self._headers)  # type: Mapping
         self._field_defs = {}  # type: Dict[FrameType, List[FieldDef]]
+        self._field_defs_view = MappingProxyType(self._field_defs)  # type: Mapping[FrameType, List[FieldDef]]
         self._log_index = 0
         self._header_size = 0
         self._path = path
         _log.info("Processing: " + path)
         self._frame_data_ptr = 0
-        self._log_pointers = []  # type: List[int]
-        self._frame_data = b''
+        self._log_pointers = array("q")  # type: array
+        self._frame_data = memoryview(b'')
         self._frame_data_len = 0
+        self._mmap = None  # type: Optional[mmap.mmap]
+        self._mmap_view = None  # type: Optional[memoryview]
         with open(path, "rb") as f:
             if not f.seekable():
                 msg = "Input file must be seekable"
                 _log.critical(msg)
                 raise IOError(msg)
+            if hasattr(os, "posix_fadvise"):
+                # logs are read front to back, let the kernel read ahead more aggressively
+                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            try:
+                # map the file into memory once, pages are loaded on demand as the frames get parsed
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError) as e:
+                _log.debug("Cannot map file into memory, frame data will be read instead ({!s})".format(e))
+            else:
+                if hasattr(mmap, "MADV_SEQUENTIAL"):
+                    self._mmap.madvise(mmap.MADV_SEQUENTIAL)
+                # a single view for the whole file, frame data of a log is a zero-copy slice of it
+                self._mmap_view = memoryview(self._mmap)
             self._find_pointers(f)
         if log_index is not None:
             self.set_log_index(log_index)
@@ -70,12 +107,21 @@ class Reader:
         if index < 1 or self.log_count < index:
             raise RuntimeError("Invalid log_index: {:d} (1 <= x < {:d})".format(index, self.log_count))
         start = self._log_pointers[index - 1]
-        with open(self._path, "rb") as f:
-            f.seek(start)
-            self._update_headers(f)
-            f.seek(start + self._header_size)
-            size = self._log_pointers[index] - start - self._header_size if index < self.log_count else None
-            self._frame_data = f.read(size) if size is not None else f.read()
+        end = self._log_pointers[index] if index < self.log_count else None
+        if self._mmap is not None:
+            if hasattr(mmap, "MADV_WILLNEED"):
+                # start loading the pages of the selected log before the decoders get to them (the range must start at
+                # a page boundary)
+                page_start = start - start % mmap.PAGESIZE
+                self._mmap.madvise(mmap.MADV_WILLNEED, page_start, (end or len(self._mmap)) - page_start)
+            self._update_headers(self._mmap, start)
+            self._frame_data = self._mmap_view[start + self._header_size:end]
+        else:
+            data = self._read_log(start, end)
+            self._update_headers(data, 0)
+            self._frame_data = memoryview(data)[self._header_size:]
+        _log.debug("End of headers at {0:d} (0x{0:X}) (headers: {1:d})"
+                   .format(start + self._header_size, len(self._headers.keys())))
         self._log_index = index
         self._frame_data_ptr = 0
         self._frame_data_len = len(self._frame_data)
@@ -83,40 +129,55 @@ class Reader:
         _log.info("Log #{:d} out of {:d} (start: 0x{:X}, size: {:d})"
                   .format(self._log_index, self.log_count, start, self._frame_data_len))
 
-    def _update_headers(self, f: BinaryIO):
-        start = f.tell()
-        while True:
-            line = f.readline()
-            if not line:
-                # nothing left to read
-                break
-            has_next = self._parse_header_line(line)
-            if not has_next:
-                f.seek(-len(line), 1)
-                _log.debug(
-                    "End of headers at {0:d} (0x{0:X}) (headers: {1:d})".format(f.tell(), len(self._headers.keys())))
-                break
-        self._header_size = f.tell() - start
-
-    def _parse_header_line(self, data: bytes) -> bool:
-        """Parse a header line and return its resulting character length.
-
-        Return None if the line cannot be parsed.
-        """
-        if data[0] != 72:  # 72 == ord('H')
-            # not a header line
-            return False
-        line = data.decode().replace("H ", "", 1)
-        name, value = line.split(':', 1)
-        self._headers[name.strip()] = [_trycast(s.strip()) for s in value.split(',')] if ',' in value \
-            else _trycast(value.strip())
-        return True
+    def close(self):
+        """Release the memory mapped log file. The reader cannot be used to read frame data afterwards.
+        """
+        self._frame_data.release()
+        self._frame_data = memoryview(b'')
+        self._frame_data_ptr = 0
+        self._frame_data_len = 0
+        if self._mmap is not None:
+            self._mmap_view.release()
+            self._mmap_view = None
+            self._mmap.close()
+            self._mmap = None
+
+    def __enter__(self) -> "Reader":
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def _read_log(self, start: int, end: Optional[int]) -> bytearray:
+        # memory mapping is not supported, read the log straight into a preallocated buffer (this bypasses the internal
+        # buffer of the file object)
+        with open(self._path, "rb") as f:
+            data = bytearray((end or os.fstat(f.fileno()).st_size) - start)
+            f.seek(start)
+            size = f.readinto(data)
+        del data[size:]
+        return data
+
+    def _update_headers(self, data: Union[bytes, bytearray, mmap.mmap], start: int):
+        # find the end of the header block and then the name and value of each line with two regex scans over the
+        # buffer instead of a loop over the lines
+        end = self._HEADERS_RE.match(data, start).end()
+        for match in self._HEADER_LINE_RE.finditer(data[start:end]):
+            self._add_header(*match.groups())
+        self._header_size = end - start
+
+    def _add_header(self, name: bytes, value: bytes):
+        """Store a header value, decoding only the name and the value tokens of the raw line.
+        """
+        self._headers[name.strip().decode()] = [_trycast_bytes(s.strip()) for s in value.split(b",")] \
+            if b"," in value else _trycast_bytes(value.strip())
 
     def _find_pointers(self, f: BinaryIO):
         start = f.tell()
         first_line = f.readline()
         f.seek(start)
-        content = f.read()
+        # search the mapped file directly instead of reading all of it into memory
+        content = self._mmap if self._mmap is not None else f.read()
         new_index = content.find(first_line)
         step = len(first_line)
         while -1 < new_index:
@@ -130,35 +191,50 @@ class Reader:
         field_defs = self._field_defs
         predictors = predictor_map
         decoders = decoder_map
-        for frame_type in FrameType:
+        frame_types = self._FRAME_TYPE_BY_VALUE
+        # scan headers once and dispatch by the frame type token
+        for header_key, header_value in headers.items():
+            if not header_key.startswith("Field "):
+                # skip headers unrelated to defining fields
+                continue
             # field header format: 'Field <FrameType> <Property>'
-            for header_key, header_value in headers.items():
-                if "Field " + frame_type.value not in header_key:
-                    # skip headers unrelated to defining fields
-                    continue
-                if frame_type not in field_defs:
-                    field_defs[frame_type] = [FieldDef(frame_type) for _ in range(len(header_value))]
-                prop = header_key.split(" ", 2)[-1]
-                for i, framedef_value in enumerate(header_value):
-                    fdef_name = field_defs[frame_type][i].name
-                    if fdef_name == "GPS_coord[1]" and framedef_value == 7:
-                        framedef_value = 256  # catch latitude
-                    field_defs[frame_type][i].__dict__[prop] = framedef_value
-                    if prop == "predictor":
-                        if framedef_value not in predictors:
-                            raise RuntimeError("No predictor found for {:d}".format(framedef_value))
-                        else:
-                            field_defs[frame_type][i].predictorfun = predictors[framedef_value]
-                    elif prop == "encoding":
-                        if framedef_value not in decoders:
-                            raise RuntimeError("No decoder found for {:d}".format(framedef_value))
-                        else:
-                            decoder = decoders[framedef_value]
-                            if decoder.__name__.endswith("_versioned"):
-                                # short circuit calls to versioned decoders
-                                # noinspection PyArgumentList
-                                decoder = decoder(headers.get("Data version"))
-                            field_defs[frame_type][i].decoderfun = decoder
+            parts = header_key.split(" ", 2)
+            frame_type = frame_types.get(parts[1])
+            if frame_type is None or len(parts) < 3:
+                continue
+            if frame_type not in field_defs:
+                field_defs[frame_type] = [FieldDef(frame_type) for _ in range(len(header_value))]
+            prop = parts[2]
+            if prop not in self._FIELD_PROPERTIES:
+                _log.debug("Skipping unknown field property: {:s}".format(header_key))
+                continue
+            fdefs = field_defs[frame_type]
+            values = [256 if fdef.name == "GPS_coord[1]" and value == 7 else value  # catch latitude
+                      for fdef, value in zip(fdefs, header_value)]
+            for fdef, value in zip(fdefs, values):
+                setattr(fdef, prop, value)
+            if prop == "predictor":
+                # resolve each distinct predictor of the row only once
+                resolved = {}
+                for value in set(values):
+                    if value not in predictors:
+                        raise RuntimeError("No predictor found for {:d}".format(value))
+                    resolved[value] = predictors[value]
+                for fdef, value in zip(fdefs, values):
+                    fdef.predictorfun = resolved[value]
+            elif prop == "encoding":
+                # resolve each distinct decoder of the row only once
+                resolved = {}
+                for value in set(values):
+                    if value not in decoders:
+                        raise RuntimeError("No decoder found for {:d}".format(value))
+                    decoder = decoders[value]
+                    if decoder.__name__.endswith("_versioned"):
+                        # short circuit calls to versioned decoders (resolved once per data version)
+                        decoder = self._resolve_versioned_decoder(decoder, headers.get("Data version"))
+                    resolved[value] = decoder
+                for fdef, value in zip(fdefs, values):
+                    fdef.decoderfun = resolved[value]
         if FrameType.INTER not in field_defs:
             # partial or missing header information
             return
@@ -166,6 +242,14 @@ class Reader:
         for i, fdef in enumerate(field_defs[FrameType.INTER]):
             fdef.name = field_defs[FrameType.INTRA][i].name
 
+    @classmethod
+    def _resolve_versioned_decoder(cls, versioned: Callable, data_version: int) -> Decoder:
+        key = (versioned, data_version)
+        decoder = cls._VERSIONED_DECODER_CACHE.get(key)
+        if decoder is None:
+            decoder = cls._VERSIONED_DECODER_CACHE[key] = versioned(data_version)
+        return decoder
+
     @property
     def log_index(self) -> int:
         """Return the currently set log index. May return 0 if `.set_log_index()` haven't been called yet.
@@ -183,40 +267,43 @@ class Reader:
         return len(self._log_pointers)
 
     @property
-    def log_pointers(self) -> List[int]:
-        """List of byte pointers to the start of each log file, including headers.
+    def log_pointers(self) -> Sequence[int]:
+        """Byte pointers to the start of each log file, including headers. This is the reader's own array, do not
+        modify it.
 
-        :type: List[int]
+        :type: Sequence[int]
         """
-        return list(self._log_pointers)
+        return self._log_pointers
 
     @property
-    def headers(self) -> Headers:
-        """Dict of parsed headers.
+    def headers(self) -> Mapping:
+        """Read-only map of parsed headers.
 
-        :type: dict
+        :type: Mapping
         """
-        return dict(self._headers)
+        return self._headers_view
 
     @property
-    def field_defs(self) -> Dict[FrameType, List[FieldDef]]:
-        """Dict of built field definitions.
+    def field_defs(self) -> Mapping[FrameType, List[FieldDef]]:
+        """Read-only map of built field definitions.
 
-        :type: dict
+        :type: Mapping
         """
-        return dict(self._field_defs)
+        return self._field_defs_view
 
     def value(self) -> Optional[int]:
         """Get current byte value.
         """
-        if self._frame_data_len == self._frame_data_ptr:
+        ptr = self._frame_data_ptr
+        if ptr == self._frame_data_len:
             return None
-        return self._frame_data[self._frame_data_ptr]
+        return self._frame_data[ptr]
 
     def has_subsequent(self, data: bytes) -> bool:
         """Return `True` if upcoming bytes equal ``data``.
         """
-        return self._frame_data[self._frame_data_ptr:self._frame_data_ptr + len(data)] == data
+        ptr = self._frame_data_ptr
+        return self._frame_data[ptr:ptr + len(data)] == data
 
     def tell(self) -> int:
         """IO protocol
@@ -228,15 +315,25 @@ class Reader:
         """
         self._frame_data_ptr = n
 
-    def __iter__(self) -> Iterator[Optional[int]]:
+    def next_byte(self) -> int:
+        """Get the next byte value, or `.EOF` (-1) at the end of the frame data. Decoders use this instead of the
+        iterator protocol, an integer comparison is cheaper than handling an optional value.
+        """
+        ptr = self._frame_data_ptr
+        if ptr == self._frame_data_len:
+            return self.EOF
+        self._frame_data_ptr = ptr + 1
+        return self._frame_data[ptr]
+
+    def __iter__(self) -> Iterator[int]:
         return self
 
-    def __next__(self) -> Optional[int]:
-        if self._frame_data_len == self._frame_data_ptr:
-            return None
-        byte = self._frame_data[self._frame_data_ptr]
-        self._frame_data_ptr += 1
-        return byte
+    def __next__(self) -> int:
+        ptr = self._frame_data_ptr
+        if ptr == self._frame_data_len:
+            raise StopIteration
+        self._frame_data_ptr = ptr + 1
+        return self._frame_data[ptr]
 
     def __len__(self) -> int:
         return self._frame_data_len
@@ -14,11 +14,19 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+import re
 from struct import pack, unpack
 from typing import Any, Callable, Union
 
 from orangebox.types import Number
 
+# the patterns accept the same literals as int() and float() (digits may be grouped with underscores)
+_DIGITS = rb"\d(?:_?\d)*"
+_INT_RE = re.compile(rb"[-+]?" + _DIGITS)
+_HEX_RE = re.compile(rb"0x(?:_?[0-9a-fA-F])+")
+_FLOAT_RE = re.compile(rb"[-+]?(?:(?:" + _DIGITS + rb")?\." + _DIGITS + rb"|" + _DIGITS + rb"\.?)(?:e[-+]?" + _DIGITS +
+                       rb")?|[-+]?(?:nan|inf(?:inity)?)", re.IGNORECASE)
+
 
 def map_to(key: Any, amap: dict) -> Callable:
     def decorator(fun: Callable) -> Callable:
@@ -69,14 +77,21 @@ def sign_extend_2bit(byte) -> int:
 
 
 def _trycast(s: str) -> Union[Number, str]:
-    """Try to cast a string to the most appropriate numeric type.
+    """Try to cast a string to the most appropriate numeric type. Uses the same rules as `_trycast_bytes`.
+    """
+    value = _trycast_bytes(s.strip().encode())
+    return s if isinstance(value, str) else value
+
+
+def _trycast_bytes(b: bytes) -> Union[Number, str]:
+    """Cast raw header bytes to the most appropriate numeric type, or decode them to a string. Accepts the same
+    literals as int() and float() (plus hex with a '0x' prefix), but tells the types apart with patterns instead of
+    exceptions.
     """
-    if s.startswith("0x"):
-        return int(s, 16)
-    try:
-        return int(s)
-    except ValueError:
-        try:
-            return float(s)
-        except ValueError:
-            return s
+    if _INT_RE.fullmatch(b):
+        return int(b)
+    if _HEX_RE.fullmatch(b):
+        return int(b, 16)
+    if _FLOAT_RE.fullmatch(b):
+        return float(b)
+    return b.decode()
@@ -16,7 +16,10 @@
 
 from collections import namedtuple
 from enum import Enum, IntEnum
-from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
+from typing import Callable, Dict, List, Optional, Tuple, TYPE_CHECKING, Union
+
+if TYPE_CHECKING:
+    from .reader import Reader
 
 
 class FrameType(Enum):
@@ -54,6 +57,9 @@ class FieldDef:
     :param predictorfun: Predictor callable (set by `.Reader` dynamically)
     :type predictorfun: Optional[Predictor]
     """
+
+    __slots__ = ("type", "name", "signed", "predictor", "encoding", "decoderfun", "predictorfun")
+
     def __init__(self,
                  frame_type: FrameType,
                  name: Optional[str] = None,
@@ -71,8 +77,8 @@ class FieldDef:
         self.predictorfun = predictorfun  # type: Predictor
 
     def __repr__(self):
-        return "<FrameDef type={type} name='{name}' signed={signed} predictor={predictor} encoding={encoding}>".format(
-            **self.__dict__)
+        return "<FrameDef type={} name='{}' signed={} predictor={} encoding={}>".format(
+            self.type, self.name, self.signed, self.predictor, self.encoding)
 
 
 class EventType(IntEnum):
@@ -107,7 +113,7 @@ Frame = namedtuple('Frame', 'type data')
 
 Headers = Dict[str, Union[str, Number, List[Number]]]
 DecodedValue = Union[int, Tuple]
-Decoder = Callable[[Iterator[int], Optional["Context"]], DecodedValue]
+Decoder = Callable[["Reader", Optional["Context"]], DecodedValue]
 Predictor = Callable[[int, "Context"], int]
 FieldDefs = Dict[FrameType, List[FieldDef]]
 
@@ -119,4 +125,4 @@ Event = namedtuple('Event', 'type data')
 :type data: dict
 """
 
-EventParser = Callable[[Iterator[int]], Optional[dict]]
+EventParser = Callable[["Reader"], Optional[dict]]